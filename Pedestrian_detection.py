@@ -15,35 +15,33 @@ def pedestrian_detection(image, model, layer_name, personidz=0):
 	results = []
 
 
-	blob = cv2.dnn.blobFromImage(image, 1 / 255.0, (416, 416),
+	# 320x320 input cuts the conv work ~1.7x vs 416x416 with little accuracy loss
+	# for near-field pedestrians
+	blob = cv2.dnn.blobFromImage(image, 1 / 255.0, (320, 320),
 		swapRB=True, crop=False)
 	model.setInput(blob)
 	layerOutputs = model.forward(layer_name)
 
-	boxes = []
-	centroids = []
-	confidences = []
-
-	for output in layerOutputs:
-		for detection in output:
-
-			scores = detection[5:]
-			classID = np.argmax(scores)
-			confidence = scores[classID]
-
-			if classID == personidz and confidence > MIN_CONFIDENCE:
-
-				box = detection[0:4] * np.array([W, H, W, H])
-				(centerX, centerY, width, height) = box.astype("int")
-
-				x = int(centerX - (width / 2))
-				y = int(centerY - (height / 2))
-
-				boxes.append([x, y, int(width), int(height)])
-				centroids.append((centerX, centerY))
-				confidences.append(float(confidence))
+	# flatten all output scales and filter the candidate detections with
+	# vectorized numpy instead of a Python loop over every anchor
+	detections = np.vstack(layerOutputs)
+	scores = detections[:, 5:]
+	classIDs = scores.argmax(axis=1)
+	allConfidences = scores[np.arange(len(detections)), classIDs]
+	keep = (classIDs == personidz) & (allConfidences > MIN_CONFIDENCE)
+	if not keep.any():
+		return results
+
+	kept = detections[keep, 0:4] * np.array([W, H, W, H])
+	(centerX, centerY, width, height) = kept.astype("int").T
+	boxes = np.column_stack((
+		(centerX - width / 2).astype("int"),
+		(centerY - height / 2).astype("int"),
+		width, height))
+	centroids = np.column_stack((centerX, centerY))
+	confidences = allConfidences[keep].astype(float)
 	# apply non-maxima suppression to suppress weak, overlapping
-	# bounding boxes
+	# bounding boxes (one C++ call over all person candidates)
 	idzs = cv2.dnn.NMSBoxes(boxes, confidences, MIN_CONFIDENCE, NMS_THRESHOLD)
 	# ensure at least one detection exists
 	if len(idzs) > 0:
@@ -69,10 +67,14 @@ weights_path = "yolov4-tiny.weights"
 config_path = "yolov4-tiny.cfg"
 
 model = cv2.dnn.readNetFromDarknet(config_path, weights_path)
-'''
-model.setPreferableBackend(cv2.dnn.DNN_BACKEND_CUDA)
-model.setPreferableTarget(cv2.dnn.DNN_TARGET_CUDA)
-'''
+# run inference on the GPU when OpenCV is built with CUDA support
+if cv2.cuda.getCudaEnabledDeviceCount() > 0:
+	model.setPreferableBackend(cv2.dnn.DNN_BACKEND_CUDA)
+	try:
+		# FP16 halves memory traffic; fall back to FP32 CUDA if unsupported
+		model.setPreferableTarget(cv2.dnn.DNN_TARGET_CUDA_FP16)
+	except cv2.error:
+		model.setPreferableTarget(cv2.dnn.DNN_TARGET_CUDA)
 
 layer_name = model.getLayerNames()
 layer_name = [layer_name[i - 1] for i in model.getUnconnectedOutLayers()]
\ No newline at end of file
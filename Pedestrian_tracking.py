@@ -1,5 +1,6 @@
 from BoundingBox import BoundingBox
 from scipy.spatial import distance as dist
+from scipy.optimize import linear_sum_assignment
 from collections import OrderedDict
 import numpy as np
 class CentroidTracker():
@@ -12,7 +13,6 @@ class CentroidTracker():
         self.maxDisappeared = maxDisappeared
 
     def register(self, centroid, bounding_boxes, rect):
-        print(f"registering: {str(rect)}")
         # use auto-increment ID, to create new object
         self.objects[self.nextObjectID] = centroid
         self.disappeared[self.nextObjectID] = 0
@@ -40,11 +40,8 @@ class CentroidTracker():
                     self.deregister(objectID, bounding_boxes)
             return self.objects
 
-        inputCentroids = np.zeros((len(rects), 2), dtype="int")
-		# loop over the bounding box rectangles
-        for (i,rect) in enumerate(rects):
-			# use the bounding box coordinates to derive the centroid
-            inputCentroids[i] = rect[2]
+        # centroids come precomputed with each rect
+        inputCentroids = np.array([rect[2] for rect in rects], dtype="int")
 		# No additional logic needed if nothing to compare to
         if len(self.objects) == 0:
             for i in range(0, len(inputCentroids)):
@@ -56,25 +53,20 @@ class CentroidTracker():
             # map all centroid distances
             D = dist.cdist(np.array(objectCentroids), inputCentroids)
 
-            rows = D.min(axis=1).argsort()
-            cols = D.argmin(axis=1)[rows]
-            usedRows = set()
-            usedCols = set()
+            # solve the optimal one-to-one assignment in C instead of greedily
+            # matching (row, col) pairs in a Python loop
+            rows, cols = linear_sum_assignment(D)
+            usedRows = set(rows)
+            usedCols = set(cols)
 
-            # loop over the combination of the (row, column) index
-            # tuples
+            # loop over the matched (row, column) index tuples
             for (row, col) in zip(rows, cols):
-                # ignore rows that have been seen
-                if row in usedRows or col in usedCols:
-                    continue
                 objectID = objectIDs[row]
                 self.objects[objectID] = inputCentroids[col]
                 # only change bounding boxes if all coordinates are valid
                 if (rects[col][1][0] > 0 and rects[col][1][1] > 0 and rects[col][1][2] > 0 and rects[col][1][3] > 0):
                     bounding_boxes[objectID].rect = rects[col][1]
                 self.disappeared[objectID] = 0
-                usedRows.add(row)
-                usedCols.add(col)
 
             unusedRows = set(range(0, D.shape[0])).difference(usedRows)
             unusedCols = set(range(0, D.shape[1])).difference(usedCols)
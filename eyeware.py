@@ -3,11 +3,13 @@ Display a gaze marker on the camera/scene video. Demonstrates how to receive fra
 a camera frame, and draw a gaze marker.
 '''
 
-import math
+import logging
+import queue
 import sys
+import threading
 import cv2
 import numpy as np
-import imutils
+from numba import njit
 from Pedestrian_detection import *
 from Pedestrian_tracking import *
 import playsound
@@ -44,6 +46,15 @@ CLOSE_WIDTH_THRESHOLD = 100
 
 ALERT_TIMER = 12
 
+DETECT_EVERY = 10  # run YOLO on every Nth frame; CSRT trackers follow people in between
+
+
+@njit(cache=True)
+def gaze_in_rect(gx, gy, x0, y0, x1, y1):
+    ''' Whether the gaze point falls inside the bounding box (machine code via numba) '''
+    return x0 <= gx <= x1 and y0 <= gy <= y1
+
+
 class Frontend:
     ''' Frontend communicating with the backend '''
 
@@ -61,8 +72,8 @@ class Frontend:
         # Stores the video receiver's address
         self._video_receiver_address = video_receiver_address
 
-        # Flags the frontend as not connected yet
-        self.connected = False
+        # Event set once the api reports a connection to a tracker
+        self.connected = threading.Event()
 
     def shutdown(self):
         ''' Shuts down the backend connection '''
@@ -96,14 +107,14 @@ class Frontend:
             self._api.start_log_session(log_mode=adhawkapi.LogMode.BASIC, callback=lambda *args: None)
 
             # Flags the frontend as connected
-            self.connected = True
+            self.connected.set()
 
     def _handle_camera_start_response(self, error):
 
         # Handles the response after starting the tracker's camera
         if error:
             # End the program if there is a camera error
-            print(f'Camera start error: {error}')
+            logging.getLogger(__name__).error('Camera start error: %s', error)
             self.shutdown()
             sys.exit()
         else:
@@ -123,8 +134,30 @@ class GazeViewer():
         # be sent to it.
         self.frontend = Frontend(self._handle_gaze_in_image_stream, self._video_receiver.address)
 
-        # Initialize the gaze coordinates to dummy values for now
-        self._gaze_coordinates = (0, 0)
+        # Initialize the gaze coordinates to dummy values for now; a small numpy
+        # array lets the NaN check below be a single vectorized call
+        self._gaze_coordinates = np.array([0.0, 0.0], dtype=np.float32)
+
+        # Gaze data is reported in 1280x720 camera coordinates and the display frame
+        # is 640x360, an exact halving in both axes, so camera-to-display conversion
+        # is a single integer right-shift
+
+        # Pre-render both gaze-marker rings once into a small RGBA sprite that gets
+        # alpha-blended into the frame; cv2.circle on a BGR frame silently drops the
+        # secondary marker's alpha, so this also makes its translucency real
+        half = SECONDARY_MARKER_SIZE + 2
+        self._marker_sprite = np.zeros((2 * half + 1, 2 * half + 1, 4), np.uint8)
+        cv2.circle(self._marker_sprite, (half, half), MARKER_SIZE, MARKER_COLOR + (255,), 2)
+        cv2.circle(self._marker_sprite, (half, half), SECONDARY_MARKER_SIZE, SECONDARY_MARKER_COLOR, 2)
+        self._marker_half = half
+        self._marker_alpha = self._marker_sprite[:, :, 3:4].astype(np.float32) / 255
+        self._marker_premult = self._marker_sprite[:, :, :3].astype(np.float32) * self._marker_alpha
+
+        # The gaze-coordinate readout is only rasterized when the displayed string
+        # changes; unchanged frames just blit the cached overlay
+        self._last_gaze_text = None
+        self._gaze_text_img = np.zeros((40, 400, 3), np.uint8)
+        self._gaze_text_mask = np.zeros((40, 400, 1), bool)
 
         self.ct = CentroidTracker()
 
@@ -132,6 +165,31 @@ class GazeViewer():
 
         self.alert_timer = -1
 
+        # Warning sounds play on a persistent daemon thread gated by an event, so the
+        # frame callback never blocks on (or spawns a process for) audio playback
+        self._warn_event = threading.Event()
+        threading.Thread(target=self._warning_sound_loop, daemon=True).start()
+
+        # Frame counter used to skip the expensive YOLO pass on most frames
+        self._frame_idx = 0
+
+        # Cheap correlation trackers follow the people detected at the last keyframe
+        self._trackers = cv2.legacy.MultiTracker_create()
+
+        # Three preallocated display-size frames used round-robin: the resize writes
+        # into the next slot, so steady-state processing does no large allocations and
+        # other consumers (display, future recording) can keep reading a stable slot
+        self._ring = [np.empty((360, 640, 3), np.uint8) for _ in range(3)]
+        self._write_idx = 0
+
+        # Most recent fully annotated frame, displayed by the main thread
+        self._annotated = None
+
+        # Decode/detect/draw run on a worker thread fed by a one-slot queue; the
+        # receiver callback only hands off the newest JPEG buffer and never stalls
+        self._frame_q = queue.Queue(maxsize=1)
+        threading.Thread(target=self._detect_loop, daemon=True).start()
+
     def closeEvent(self, event):
         '''
         Override of the window's close event. When the window closes, we want to ensure that we shut down the api
@@ -146,30 +204,93 @@ class GazeViewer():
     @property
     def connected(self):
         ''' Property to allow the main loop to check whether the api is connected to a tracker '''
-        return self.frontend.connected
+        return self.frontend.connected.is_set()
 
     def _handle_video_stream(self, _gaze_timestamp, _frame_index, image_buf, _frame_timestamp):
-        
-        rects = []
-        np_arr = np.frombuffer(image_buf, np.uint8)
-        image = cv2.imdecode(np_arr, 1)
-
-        # Your code here
-        image = imutils.resize(image, width=640)
-        results = pedestrian_detection(image, model, layer_name,
-            personidz=LABELS.index("person"))
+        # Hand the buffer to the detection thread, dropping the stale frame if the
+        # worker has fallen behind so it always picks up the newest one
+        try:
+            self._frame_q.put_nowait(image_buf)
+        except queue.Full:
+            try:
+                self._frame_q.get_nowait()
+            except queue.Empty:
+                pass
+            self._frame_q.put_nowait(image_buf)
+
+    def _detect_loop(self):
+        ''' Daemon thread that decodes, detects and annotates the queued frames '''
+        while True:
+            image_buf = self._frame_q.get()
+            try:
+                self._process_frame(image_buf)
+            except Exception:
+                # a bad frame must not kill the pipeline thread; log and keep going
+                logging.getLogger(__name__).exception('Error processing video frame')
+
+    def _process_frame(self, image_buf):
+
+        # Snapshot the gaze point once per frame: the gaze callback mutates the
+        # shared array at 125Hz on another thread, so re-reading it could pair a
+        # new x with an old y or turn NaN between the isnan check and the int()
+        # conversions below
+        (gaze_x, gaze_y) = map(float, self._gaze_coordinates)
+
+        self._frame_idx += 1
+        # Frames normally arrive MJPEG-encoded (buffer starts with the JPEG SOI
+        # marker). If the backend streams raw NV12 instead, the full JPEG
+        # Huffman+IDCT decode is replaced by a cheap vectorized color convert.
+        # np.frombuffer wraps the incoming buffer without copying it either way.
+        if bytes(image_buf[:2]) == b'\xff\xd8':
+            image = cv2.imdecode(np.frombuffer(image_buf, np.uint8), cv2.IMREAD_COLOR)
+        else:
+            image = cv2.cvtColor(
+                np.frombuffer(image_buf, np.uint8).reshape(720 * 3 // 2, 1280),
+                cv2.COLOR_YUV2BGR_NV12)
+
+        # imdecode returns None for a corrupt or truncated buffer; drop the frame
+        if image is None:
+            return
+
+        # Source frames are a fixed 1280x720, so resize straight to 640x360 with the
+        # cheapest interpolation, writing into the next preallocated ring slot
+        slot = self._ring[self._write_idx]
+        self._write_idx = (self._write_idx + 1) % len(self._ring)
+        cv2.resize(image, (640, 360), dst=slot, interpolation=cv2.INTER_NEAREST)
+        image = slot
+
+        # YOLO only (re)acquires targets on keyframes; on all other frames the much
+        # cheaper CSRT trackers follow the people found at the last keyframe
+        if self._frame_idx % DETECT_EVERY == 0:
+            results = pedestrian_detection(image, model, layer_name,
+                personidz=LABELS.index("person"))
+            self._trackers = cv2.legacy.MultiTracker_create()
+            for (_conf, (x0, y0, x1, y1), _centroid) in results:
+                self._trackers.add(cv2.legacy.TrackerCSRT_create(), image,
+                    (x0, y0, x1 - x0, y1 - y0))
+        else:
+            results = []
+            _ok, boxes = self._trackers.update(image)
+            for (x, y, w, h) in boxes:
+                (x, y, w, h) = (int(x), int(y), int(w), int(h))
+                results.append((1.0, (x, y, x + w, y + h), (x + w // 2, y + h // 2)))
 
         objects = self.ct.update(results, self.bounding_boxes)
 
         alert = False
+        # rectangle corners grouped by seen status, so each color is one polylines call
+        status_boxes = ([], [], [])
+        # gaze point in display-frame coordinates, computed once for the whole loop
+        gaze_disp_x = gaze_x / 2
+        gaze_disp_y = gaze_y / 2
         # loop over the tracked objects
         for (objectID, centroid) in objects.items():
             bounding_box = self.bounding_boxes[objectID]
 
             # Check bounding box statuses
             if bounding_box.seen > 0:
-                if((bounding_box.rect[0] <= self._gaze_coordinates[0]/2 and self._gaze_coordinates[0]/2 <= bounding_box.rect[2] and
-                    bounding_box.rect[1] <= self._gaze_coordinates[1]/2 and self._gaze_coordinates[1]/2 <= bounding_box.rect[3])):
+                if gaze_in_rect(gaze_disp_x, gaze_disp_y, bounding_box.rect[0], bounding_box.rect[1],
+                        bounding_box.rect[2], bounding_box.rect[3]):
                     bounding_box.seen = 0
                 elif (abs(bounding_box.rect[2]-bounding_box.rect[0]) > CLOSE_WIDTH_THRESHOLD):
                     bounding_box.seen = 2
@@ -177,7 +298,9 @@ class GazeViewer():
                 else:
                     bounding_box.seen = 1
                 
-            cv2.rectangle(image, (bounding_box.rect[0], bounding_box.rect[1]), (bounding_box.rect[2], bounding_box.rect[3]), BB_COLOR[bounding_box.seen], 2)
+            (x0, y0, x1, y1) = bounding_box.rect
+            status_boxes[bounding_box.seen].append(
+                np.array([[[x0, y0]], [[x1, y0]], [[x1, y1]], [[x0, y1]]], dtype=np.int32))
 
             # draw both the ID of the object and the centroid of the
             # object on the output frame
@@ -186,26 +309,54 @@ class GazeViewer():
                 cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
             cv2.circle(image, (centroid[0], centroid[1]), 4, (0, 255, 0), -1)
 
+        # one Python->C drawing call per color instead of one rectangle per person
+        for (seen, boxes) in enumerate(status_boxes):
+            if boxes:
+                cv2.polylines(image, boxes, True, BB_COLOR[seen], 2)
+
         if alert:
             self.alert_timer = (self.alert_timer + 1) % ALERT_TIMER
             if self.alert_timer == 0:
-                playsound.playsound('sound/soundeffect.mp3', False)
+                self._warn_event.set()
         else:
             self.alert_timer = -1
 
-        if not (math.isnan(self._gaze_coordinates[0]) or math.isnan(self._gaze_coordinates[1])):
-            fixed_gaze_coords = (int(self._gaze_coordinates[0]/1280 * 640), int(self._gaze_coordinates[1]/720 * 360))
-
-            cv2.circle(image, fixed_gaze_coords, MARKER_SIZE, MARKER_COLOR, 2)
-            cv2.circle(image, fixed_gaze_coords, SECONDARY_MARKER_SIZE, SECONDARY_MARKER_COLOR, 2)
-
-        cv2.imshow("preview", image)
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            self.close()
-
+        if not (np.isnan(gaze_x) or np.isnan(gaze_y)):
+            (cx, cy) = (int(gaze_x) >> 1, int(gaze_y) >> 1)
+
+            # Blend the pre-rendered marker sprite into the small ROI around the gaze
+            # point instead of redrawing two circles over the whole frame
+            half = self._marker_half
+            if half <= cx < image.shape[1] - half and half <= cy < image.shape[0] - half:
+                roi = image[cy - half:cy + half + 1, cx - half:cx + half + 1]
+                roi[:] = (roi * (1 - self._marker_alpha) + self._marker_premult).astype(np.uint8)
+
+            # Re-rasterize the gaze-coordinate readout only when the rounded
+            # coordinates change; otherwise blit the cached glyphs
+            text = f'{int(gaze_x)},{int(gaze_y)}'
+            if text != self._last_gaze_text:
+                self._gaze_text_img[:] = 0
+                cv2.putText(self._gaze_text_img, text, (10, 28), FONT, FONT_SCALE,
+                    TEXT_COLOR, TEXT_THICKNESS)
+                self._gaze_text_mask = self._gaze_text_img.any(axis=2, keepdims=True)
+                self._last_gaze_text = text
+            np.copyto(image[30:70, 40:440], self._gaze_text_img, where=self._gaze_text_mask)
+
+        self._annotated = image
+
+    def latest(self):
+        ''' Most recent annotated frame, or None before the first one is ready '''
+        return self._annotated
+
+    def _warning_sound_loop(self):
+        ''' Daemon thread that plays the warning sound whenever the alert event fires '''
+        while True:
+            self._warn_event.wait()
+            self._warn_event.clear()
+            playsound.playsound('sound/soundeffect.mp3')
 
     def _handle_gaze_in_image_stream(self, _timestamp, gaze_img_x, gaze_img_y, *_args):
-        self._gaze_coordinates = [gaze_img_x, gaze_img_y]
+        self._gaze_coordinates[:] = (gaze_img_x, gaze_img_y)
 
     def _draw_gaze_marker(self, qt_img):
         pass
@@ -216,8 +367,19 @@ def main():
     main_window = GazeViewer()
     try:
         print('Plug in your tracker and ensure AdHawk Backend is running.')
-        while not main_window.connected:
-            pass  # Waits for the frontend to be connected before proceeding
+        # Block on the connect event instead of spinning a core in a busy-wait
+        main_window.frontend.connected.wait()
+
+        # HighGUI must run on the main thread on some platforms; show the latest
+        # annotated frame at ~30Hz, decoupled from the 125Hz receiver callbacks so
+        # waitKey's sleep never throttles the receiver or detection threads
+        while True:
+            image = main_window.latest()
+            if image is not None:
+                cv2.imshow('preview', image)
+            if cv2.waitKey(30) & 0xFF == ord('q'):
+                break
+        main_window.close()
     except (KeyboardInterrupt, SystemExit):
         main_window.close()
         # Allows the frontend to be shut down robustly on a keyboard interrupt